@@ -1,183 +1,163 @@
-from flask import Flask, request, render_template, send_file, redirect, url_for
+from flask import Flask, request, render_template, send_file, redirect, url_for, jsonify, abort, Response
 import json
-from presets import load_presets, save_presets, BASE_PRESET
-from zipfile import ZipFile
+from presets import store as preset_store, preset_params, DEFAULT_PRESET
+from batch import run_batch, stream_zip, BATCH_WORKERS, BATCH_MAX_IN_FLIGHT
+from jobs import JobQueue, QueueFull, RESULT_NAME
+from preview import PreviewRenderer
+import metrics
 import tempfile
-from PIL import Image, ImageEnhance, ImageFilter, ImageChops, ImageDraw
 import io
 import os
 
 app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['BATCH_WORKERS'] = BATCH_WORKERS
+app.config['BATCH_MAX_IN_FLIGHT'] = BATCH_MAX_IN_FLIGHT
 
 # Ensure the upload folder exists
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
-# --- Image Editing Functions ---
-def apply_warmth(img, warmth_factor=1.08, warm_r=None, warm_g=None):
-    r, g, b = img.split()
-    if warm_r is not None and warm_g is not None:
-        r = r.point(lambda i: min(255, max(0, i * warm_r)))
-        g = g.point(lambda i: min(255, max(0, i * warm_g)))
-    else:
-        r = r.point(lambda i: min(255, max(0, i * warmth_factor)))
-        g = g.point(lambda i: min(255, max(0, i * (1 - (warmth_factor - 1) / 3))))
-    return Image.merge('RGB', (r, g, b))
-
-def add_soft_glow(image, strength=0.6, blur_radius=10):
-    blurred = image.filter(ImageFilter.GaussianBlur(radius=blur_radius))
-    return Image.blend(image, blurred, strength)
-
-def edit_image(image, params):
-    # Warmth
-    image = apply_warmth(
-        image,
-        warmth_factor=params.get('warmth_factor', 1.08),
-        warm_r=params.get('warm_r'),
-        warm_g=params.get('warm_g')
-    )
-    # Glow
-    if params.get('glow_strength', 0) > 0:
-        glow = image.filter(ImageFilter.GaussianBlur(radius=params.get('glow_blur', 8)))
-        image = Image.blend(image, glow, alpha=params.get('glow_strength', 0.15))
-    # Brightness
-    image = ImageEnhance.Brightness(image).enhance(params.get('brightness', 1.05))
-    # Contrast
-    image = ImageEnhance.Contrast(image).enhance(params.get('contrast', 1.12))
-    # Vibrance/Saturation
-    vibrance = params.get('vibrance', 1.10)
-    image = ImageEnhance.Color(image).enhance(vibrance)
-    # Color (legacy, for compatibility)
-    image = ImageEnhance.Color(image).enhance(params.get('color', 1.0))
-    # Grain
-    if params.get('grain_strength', 0) > 0:
-        image = add_film_grain(image, params.get('grain_strength', 0))
-    # Sun Traces
-    if params.get('sun_traces', 0) > 0:
-        image = add_sun_traces(image, params.get('sun_traces', 0))
-    # Sharpness
-    sharpness = params.get('sharpness', 1.3)
-    if sharpness > 0:
-        image = image.filter(ImageFilter.UnsharpMask(radius=2, percent=int(sharpness*100), threshold=3))
-    return image
-
-def add_film_grain(image, grain_strength=15):
-    width, height = image.size
-    noise = Image.effect_noise((width, height), grain_strength)
-    noise = noise.convert("L")
-    noise_colored = Image.merge("RGB", (noise, noise, noise))
-    return ImageChops.add(image, noise_colored, scale=2.0)
-
-def add_light_leak(image):
-    leak = Image.new("RGB", image.size, (0, 0, 0))
-    draw = ImageDraw.Draw(leak)
-    for i in range(300):
-        color = (255, 80, 60, max(0, 200 - i))
-        draw.ellipse([-100 - i, -100 - i, 300 + i, 300 + i], fill=color)
-    leak = leak.filter(ImageFilter.GaussianBlur(radius=80))
-    final = Image.blend(image, leak, alpha=0.15)
-    return final
-
-def add_sun_traces(image):
-    overlay = Image.new("RGB", image.size, (255, 200, 150))
-    draw = ImageDraw.Draw(overlay)
-    for i in range(400):
-        color = (255, 210, 160)
-        draw.ellipse([-200 - i, -200 - i, 400 + i, 400 + i], fill=color)
-    overlay = overlay.filter(ImageFilter.GaussianBlur(radius=100))
-    final = Image.blend(image, overlay, alpha=0.12)
-    return final
+job_queue = JobQueue(
+    os.path.join(os.path.abspath(UPLOAD_FOLDER), 'jobs'),
+    batch_workers=app.config['BATCH_WORKERS'],
+    max_in_flight=app.config['BATCH_MAX_IN_FLIGHT']
+)
+preview_renderer = PreviewRenderer()
+
+# The preset picked in the form, falling back to the base values
+def selected_preset():
+    name = request.form.get('preset', 'base')
+    return name, preset_store.get(name) or DEFAULT_PRESET
+
+# Get slider values or preset. Fields left at the preset's own values reuse
+# its compiled parameters, so an unchanged preset needs no parsing.
+def form_values(preset):
+    values = {}
+    changed = False
+    for key, default in preset.values.items():
+        if isinstance(default, bool):
+            value = key in request.form
+        else:
+            raw = request.form.get(key)
+            if raw is None or raw == preset.form[key]:
+                value = default
+            else:
+                value = type(default)(raw)
+        changed = changed or value != default
+        values[key] = value
+    return values, (preset_params(values) if changed else preset.params)
+
+def uploaded_files():
+    files = request.files.getlist('file')
+    return [(f.filename, f.stream) for f in files if f and f.filename]
 
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
-    presets = load_presets()
-    selected_preset = request.form.get('preset', 'base')
-    preset_values = presets.get(selected_preset, BASE_PRESET)
+    selected_name, preset = selected_preset()
     if request.method == 'POST':
-        if 'file' not in request.files:
-            return redirect(request.url)
-        files = request.files.getlist('file')
-        if not files or all(f.filename == '' for f in files):
+        uploads = uploaded_files()
+        if not uploads:
             return redirect(request.url)
 
-        # Get slider values or preset
-
-        warmth_factor = float(request.form.get('warmth_factor', preset_values.get('warmth_factor', 1.08)))
-        warm_r = float(request.form.get('warm_r', preset_values['warm_r']))
-        warm_g = float(request.form.get('warm_g', preset_values['warm_g']))
-        glow_strength = float(request.form.get('glow_strength', preset_values['glow_strength']))
-        glow_blur = int(request.form.get('glow_blur', preset_values['glow_blur']))
-        brightness = float(request.form.get('brightness', preset_values['brightness']))
-        contrast = float(request.form.get('contrast', preset_values['contrast']))
-        vibrance = float(request.form.get('vibrance', preset_values.get('vibrance', 1.10)))
-        color = float(request.form.get('color', preset_values['color']))
-        grain_strength = int(request.form.get('grain_strength', preset_values['grain_strength']))
-        sharpness = float(request.form.get('sharpness', preset_values.get('sharpness', 1.3)))
-        sun_traces = int(request.form.get('sun_traces', preset_values.get('sun_traces', 0)))
-        add_grain = 'grain_effect' in request.form
-        add_sun_traces_effect = 'sun_traces_effect' in request.form
+        values, params = form_values(preset)
 
         # Save preset if requested
         if request.form.get('save_preset'):
             new_preset_name = request.form.get('preset_name', '').strip()
             if new_preset_name:
-                presets[new_preset_name] = {
-                    "warmth_factor": warmth_factor,
-                    "warm_r": warm_r,
-                    "warm_g": warm_g,
-                    "glow_strength": glow_strength,
-                    "glow_blur": glow_blur,
-                    "brightness": brightness,
-                    "contrast": contrast,
-                    "vibrance": vibrance,
-                    "color": color,
-                    "grain_strength": grain_strength,
-                    "sharpness": sharpness,
-                    "sun_traces": sun_traces,
-                    "grain_effect": add_grain,
-                    "sun_traces_effect": add_sun_traces_effect
-                }
-                save_presets(presets)
-
-        progress_steps = []
-        total = len([f for f in files if f.filename])
-        current = 0
-        zip_folder = os.path.join(os.getcwd(), 'uploads')
-        if not os.path.exists(zip_folder):
-            os.makedirs(zip_folder)
-        zip_path = os.path.join(zip_folder, 'edited_photos.zip')
-        with ZipFile(zip_path, 'w') as zipf:
-            for file in files:
-                if file and file.filename:
-                    current += 1
-                    step_msg = f"Processing {file.filename} ({current}/{total})..."
-                    progress_steps.append(step_msg)
-                    img_stream = io.BytesIO(file.read())
-                    image = Image.open(img_stream).convert('RGB')
-                    # Use custom parameters
-                    params = {
-                        'warmth_factor': warmth_factor,
-                        'warm_r': warm_r,
-                        'warm_g': warm_g,
-                        'glow_strength': glow_strength,
-                        'glow_blur': glow_blur,
-                        'brightness': brightness,
-                        'contrast': contrast,
-                        'vibrance': vibrance,
-                        'color': color,
-                        'grain_strength': grain_strength if add_grain else 0,
-                        'sun_traces': sun_traces if add_sun_traces_effect else 0,
-                        'sharpness': sharpness
-                    }
-                    final_image = edit_image(image, params)
-                    out_path = os.path.join(zip_folder, f'edited_{file.filename}')
-                    final_image.save(out_path, format='JPEG')
-                    zipf.write(out_path, arcname=f'edited_{file.filename}')
-        # After processing, show progress summary before download
-        return render_template('index.html', progress_steps=progress_steps, show_progress=True, presets=presets, selected_preset=selected_preset, preset_values=preset_values)
-    return render_template('index.html', show_progress=False, presets=presets, selected_preset=selected_preset, preset_values=preset_values)
+                preset_store.save(new_preset_name, values)
+
+        try:
+            job = job_queue.submit(uploads, params)
+        except QueueFull as e:
+            return render_template('index.html', error=str(e), presets=preset_store.presets(), selected_preset=selected_name, preset_values=preset.values), 503, {'Retry-After': '30'}
+        return redirect(url_for('job_page', job_id=job.id))
+    return render_template('index.html', presets=preset_store.presets(), selected_preset=selected_name, preset_values=preset.values)
+
+# Edit the uploads in this request and stream the ZIP back as each photo is
+# done. Edited photos never touch the disk, and only the photos in flight are
+# held in memory, however large the batch.
+@app.route('/download', methods=['POST'])
+def download_zip():
+    uploads = uploaded_files()
+    if not uploads:
+        return redirect(url_for('upload_file'))
+    _, params = form_values(selected_preset()[1])
+    # The request closes its files as soon as this view returns, so hand the
+    # upload streams over to the response and close them once it is sent
+    for f in request.files.getlist('file'):
+        f.stream = io.BytesIO()
+
+    def generate():
+        try:
+            results = run_batch(
+                uploads,
+                params,
+                workers=app.config['BATCH_WORKERS'],
+                max_in_flight=app.config['BATCH_MAX_IN_FLIGHT']
+            )
+            yield from stream_zip(results)
+        finally:
+            for _, stream in uploads:
+                stream.close()
+
+    return Response(
+        generate(),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={RESULT_NAME}'}
+    )
+
+# Decode an upload once into a preview proxy; later renders refer to it by key
+@app.route('/preview', methods=['POST'])
+def preview_upload():
+    uploads = uploaded_files()
+    if not uploads:
+        return jsonify(error='no file uploaded'), 400
+    try:
+        key = preview_renderer.load(uploads[0][1].read())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    proxy = preview_renderer.proxy(key)
+    return jsonify(key=key, width=proxy.width, height=proxy.height)
+
+# Render the current slider values on a cached proxy as a JPEG
+@app.route('/preview/<key>', methods=['POST'])
+def preview_render(key):
+    _, params = form_values(selected_preset()[1])
+    data = preview_renderer.render_jpeg(key, params)
+    if data is None:
+        return jsonify(error='preview expired, upload the file again'), 404
+    return Response(data, mimetype='image/jpeg', headers={'Cache-Control': 'no-store'})
+
+# Pipeline stage latencies, throughput and bytes in/out (needs PIPELINE_METRICS=1)
+@app.route('/metrics')
+def pipeline_metrics():
+    return jsonify(metrics.registry.snapshot())
+
+@app.route('/jobs/<job_id>')
+def job_page(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return render_template('progress.html', job=job.progress())
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.progress())
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    if job.status != 'done':
+        return jsonify(job.progress()), 409
+    return send_file(job_queue.result_path(job.id), as_attachment=True, download_name=RESULT_NAME)
 
 if __name__ == '__main__':
     app.run(debug=False)
@@ -0,0 +1,174 @@
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from zipfile import ZipFile
+from collections import deque
+from editor import edit_image, edit_image_tiled, TILED_MIN_PIXELS
+from PIL import Image, UnidentifiedImageError
+import overlays
+import metrics
+import threading
+import io
+import os
+
+# Batch execution engine: fans edit_image out to a process pool. Only encoded
+# bytes cross the process boundary, and at most `max_in_flight` files are
+# submitted at once, so no more than that many decoded images exist at a time.
+
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_MAX_IN_FLIGHT = int(os.environ.get('BATCH_MAX_IN_FLIGHT', BATCH_WORKERS * 2))
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+# Workers keep no whole-frame overlays (see overlays.set_cache_mb)
+def _init_worker():
+    overlays.set_cache_mb(0)
+
+# Shared pool, created on first use and reused across requests
+def get_pool(workers=None):
+    global _pool, _pool_workers
+    workers = workers or BATCH_WORKERS
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            _pool_workers = workers
+        return _pool
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+# Runs in a worker: decode, edit and encode one file. With `instrument`, the
+# stage timings are returned alongside the encoded bytes.
+def process_file(data, params, format='JPEG', instrument=False, options=None):
+    with metrics.collect(instrument) as records:
+        with metrics.timer('file_total'):
+            with metrics.timer('decode'):
+                try:
+                    image = Image.open(io.BytesIO(data))
+                except UnidentifiedImageError:
+                    raise ValueError('not a supported image file') from None
+                image = image.convert('RGB')
+            if image.width * image.height > TILED_MIN_PIXELS:
+                final_image = edit_image_tiled(image, params)
+            else:
+                final_image = edit_image(image, params)
+            out = io.BytesIO()
+            with metrics.timer('encode'):
+                final_image.save(out, format=format, **(options or {}))
+    return out.getvalue(), records
+
+# Submit to `pool`, moving to a fresh pool if it broke since the last call
+# (a worker died while no result was being collected). Returns the pool the
+# work went to and its future; if the fresh pool fails too, the future
+# carries the error so the file is reported as failed.
+def _submit(pool, workers, *args):
+    for _ in range(2):
+        try:
+            return pool, pool.submit(process_file, *args)
+        except (BrokenProcessPool, RuntimeError) as e:
+            error = e
+            _reset_pool(pool)
+            pool = get_pool(workers)
+    future = Future()
+    future.set_exception(error)
+    return pool, future
+
+# Result of one file: `data` holds the encoded output, or `error` says why it failed
+class BatchResult:
+    def __init__(self, index, filename, data=None, error=None, timings=()):
+        self.index = index
+        self.filename = filename
+        self.data = data
+        self.error = error
+        self.timings = timings
+
+    @property
+    def ok(self):
+        return self.error is None
+
+def _collect(index, filename, future):
+    try:
+        data, timings = future.result()
+        return BatchResult(index, filename, data=data, timings=timings)
+    except BrokenProcessPool:
+        return BatchResult(index, filename, error='worker process died')
+    except Exception as e:
+        return BatchResult(index, filename, error=f'{type(e).__name__}: {e}')
+
+# Edit every (filename, data) item and yield a BatchResult per item in input
+# order. `data` may be bytes or a readable file object; it is read only when
+# the item is submitted. A failing file is reported, not raised. `options` are
+# passed to Image.save (e.g. quality, progressive).
+def run_batch(items, params, workers=None, max_in_flight=None, format='JPEG', options=None):
+    max_in_flight = max(1, max_in_flight or BATCH_MAX_IN_FLIGHT)
+    pool = get_pool(workers)
+    pending = deque()
+    items = iter(enumerate(items))
+    exhausted = False
+    while pending or not exhausted:
+        while not exhausted and len(pending) < max_in_flight:
+            try:
+                index, (filename, data) = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            if hasattr(data, 'read'):
+                data = data.read()
+            pool, future = _submit(pool, workers, data, params, format, metrics.enabled(), options)
+            pending.append((index, filename, len(data), pool, future))
+        if not pending:
+            break
+        index, filename, bytes_in, owner, future = pending.popleft()
+        result = _collect(index, filename, future)
+        if metrics.enabled():
+            metrics.registry.merge(result.timings)
+            metrics.registry.count_image(bytes_in, len(result.data or b''), result.ok)
+        if owner is pool and isinstance(future.exception(), BrokenProcessPool):
+            # A worker died (e.g. killed for memory). Files already in flight
+            # report the failure; the rest go to a fresh pool.
+            _reset_pool(pool)
+            pool = get_pool(workers)
+        yield result
+
+# Write-only, unseekable sink for ZipFile; drain() hands back what was written
+class _ZipSink(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+# Pack BatchResults into a ZIP and yield the archive bytes as each file is
+# added, so it can be streamed to the client without a temporary file.
+# Failures are listed in errors.txt at the end of the archive.
+def stream_zip(results):
+    sink = _ZipSink()
+    errors = []
+    with ZipFile(sink, 'w') as zipf:
+        for result in results:
+            if result.ok:
+                with metrics.timer('zip_write', len(result.data)):
+                    zipf.writestr(f'edited_{result.filename}', result.data)
+            else:
+                errors.append(f'{result.filename}: {result.error}')
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        if errors:
+            zipf.writestr('errors.txt', '\n'.join(errors) + '\n')
+    yield sink.drain()
@@ -0,0 +1,143 @@
+from editor import edit_image, edit_image_tiled, TILED_MIN_PIXELS
+from presets import PresetStore, PRESETS_FILE
+from PIL import Image
+import argparse
+import platform
+import json
+import time
+import sys
+import io
+import os
+import PIL
+import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Benchmark the editing pipeline for every preset in presets.json: each preset
+# runs over generated test images of several sizes, every pipeline stage and
+# the JPEG encode are timed, and the results are written as JSON. With
+# --baseline, stages that got slower than the threshold are reported and the
+# exit status is 1, so a regression can fail a pre-deploy check.
+#
+#     python bench.py --sizes 1 12 50 --repeat 3 --output bench_results.json
+#     python bench.py --baseline bench_results.json
+
+DEFAULT_SIZES_MP = (1, 5, 12, 24, 50)
+
+# Deterministic 3:2 test image with smooth gradients and fine detail
+def test_image(megapixels):
+    width = int((megapixels * 1_000_000 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    size = (width, height)
+    r = Image.linear_gradient('L').resize(size)
+    g = Image.radial_gradient('L').resize(size)
+    b = Image.effect_mandelbrot(size, (-2.0, -1.0, 1.0, 1.0), 64)
+    return Image.merge('RGB', (r, g, b))
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def run_case(image, params, repeat):
+    runs = []
+    for _ in range(repeat):
+        source = image.copy()
+        with metrics.collect() as records:
+            start = time.perf_counter()
+            if source.width * source.height > TILED_MIN_PIXELS:
+                edited = edit_image_tiled(source, params)
+            else:
+                edited = edit_image(source, params)
+            edit_s = time.perf_counter() - start
+            out = io.BytesIO()
+            with metrics.timer('encode'):
+                edited.save(out, format='JPEG')
+            total_s = time.perf_counter() - start
+        stages = {}
+        for name, seconds, _ in records:
+            stages[name] = stages.get(name, 0.0) + seconds
+        runs.append({'edit_s': edit_s, 'total_s': total_s, 'bytes_out': out.tell(), 'stages': stages})
+    # Report the fastest run: the least disturbed by the rest of the machine
+    best = min(runs, key=lambda r: r['total_s'])
+    return {
+        'edit_s': round(best['edit_s'], 4),
+        'total_s': round(best['total_s'], 4),
+        'images_per_s': round(1 / best['total_s'], 3),
+        'bytes_out': best['bytes_out'],
+        'stages_s': {name: round(s, 4) for name, s in sorted(best['stages'].items())},
+    }
+
+# Stages (and totals) slower than baseline by more than `threshold`
+def regressions(results, baseline, threshold):
+    found = []
+    old_cases = {(c['preset'], c['megapixels']): c for c in baseline['cases']}
+    for case in results['cases']:
+        old = old_cases.get((case['preset'], case['megapixels']))
+        if old is None:
+            continue
+        timings = dict(case['stages_s'], total=case['total_s'])
+        old_timings = dict(old['stages_s'], total=old['total_s'])
+        for name, seconds in timings.items():
+            before = old_timings.get(name)
+            # Ignore stages too short to time reliably
+            if before and before > 0.005 and seconds > before * (1 + threshold):
+                found.append(f"{case['preset']} @ {case['megapixels']}MP {name}: "
+                             f"{before:.4f}s -> {seconds:.4f}s (+{(seconds / before - 1) * 100:.0f}%)")
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the editing pipeline for every preset.')
+    parser.add_argument('--presets', default=PRESETS_FILE, help='presets file (default: %(default)s)')
+    parser.add_argument('--only', nargs='*', help='benchmark only these presets')
+    parser.add_argument('--sizes', nargs='*', type=float, default=DEFAULT_SIZES_MP,
+                        help='test image sizes in megapixels (default: 1 5 12 24 50)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the fastest is kept')
+    parser.add_argument('--output', default='bench_results.json', help='results file (default: %(default)s)')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='slowdown that counts as a regression (default: 0.10)')
+    args = parser.parse_args(argv)
+
+    presets = PresetStore(args.presets).presets()
+    names = args.only or list(presets)
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'cases': [],
+    }
+    for megapixels in args.sizes:
+        image = test_image(megapixels)
+        for name in names:
+            case = run_case(image, presets[name].params, args.repeat)
+            case.update(preset=name, megapixels=megapixels, size=list(image.size))
+            results['cases'].append(case)
+            print(f"{name:>20} {megapixels:>5}MP  {case['total_s']:.3f}s  "
+                  f"{case['images_per_s']:.2f} img/s", flush=True)
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Wrote {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.threshold)
+        for line in found:
+            print('REGRESSION', line)
+        if found:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
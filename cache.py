@@ -0,0 +1,59 @@
+from collections import OrderedDict
+import threading
+
+# Bytes per pixel of single-band modes; Pillow stores every multi-band 8-bit
+# mode (RGB included) as 4 bytes per pixel
+_BAND_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I': 4, 'F': 4}
+
+# Pixel memory Pillow allocates for `image`
+def image_bytes(image):
+    if len(image.getbands()) > 1:
+        per_pixel = 4
+    else:
+        per_pixel = _BAND_BYTES.get(image.mode, 4)
+    return image.width * image.height * per_pixel
+
+# Thread-safe LRU of images, bounded by their total pixel memory
+class ImageLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, image):
+        nbytes = image_bytes(image)
+        if nbytes > self.max_bytes:
+            return image
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= image_bytes(old)
+            self._items[key] = image
+            self.size += nbytes
+            self._evict()
+        return image
+
+    # Change the bound, evicting down to it (0 disables the cache)
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= image_bytes(evicted)
+
+    def cached(self, key, build):
+        image = self.get(key)
+        if image is None:
+            image = self.put(key, build())
+        return image
@@ -0,0 +1,217 @@
+from batch import run_batch, BATCH_WORKERS, BATCH_MAX_IN_FLIGHT
+from presets import PresetStore, PRESETS_FILE
+from PIL import features
+import argparse
+import hashlib
+import json
+import time
+import sys
+import os
+
+# Headless batch mode: edit a directory tree with a preset from presets.json,
+# using every core. A manifest in the output directory records, per input,
+# its content hash and the settings its output was made with, so re-runs skip
+# inputs whose output is already up to date and an interrupted run picks up
+# where it stopped.
+#
+#     python cli.py photos/ edited/ --preset "dreamy look" --quality 85 --progressive
+#     python cli.py photos/ edited/ --preset base --format webp --quality 80
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.tif', '.tiff', '.webp', '.bmp'}
+FORMATS = {'jpeg': ('JPEG', '.jpg'), 'webp': ('WEBP', '.webp')}
+MANIFEST_NAME = '.photo-editor-manifest.json'
+# Save the manifest at least this often while a run is in progress
+MANIFEST_FLUSH_SECONDS = 10
+
+# Image files under `root`, skipping the `exclude` directory (the output
+# directory, when it sits inside the input tree)
+def find_images(root, exclude=None):
+    exclude = os.path.realpath(exclude) if exclude else None
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames if os.path.realpath(os.path.join(dirpath, d)) != exclude
+        )
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, root).replace(os.sep, '/')
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        print(f'warning: ignoring unreadable manifest {path}', file=sys.stderr)
+        return {}
+
+def save_manifest(path, manifest):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+# Hash of everything besides the input that decides what the output looks like
+def settings_key(params, format, options):
+    blob = json.dumps({'params': params, 'format': format, 'options': options}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+class Run:
+    def __init__(self, input_dir, output_dir, params, format, extension, options):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.params = params
+        self.format = format
+        self.extension = extension
+        self.options = options
+        self.settings = settings_key(params, format, options)
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.manifest = load_manifest(self.manifest_path)
+        self.pending = {}
+        self.skipped = 0
+
+    def output_path(self, rel):
+        return os.path.join(self.output_dir, os.path.splitext(rel)[0] + self.extension)
+
+    # Inputs that differ only in extension (b.jpg, b.png) would be written to
+    # the same output; returns each such group
+    def collisions(self, rels):
+        by_output = {}
+        for rel in rels:
+            by_output.setdefault(os.path.normcase(self.output_path(rel)), []).append(rel)
+        return [group for group in by_output.values() if len(group) > 1]
+
+    # Up to date when the input's content and the settings match the manifest
+    # and the recorded output is still there. The hash is only recomputed when
+    # the input's size or mtime changed since it was recorded.
+    def _check(self, rel):
+        path = os.path.join(self.input_dir, rel)
+        st = os.stat(path)
+        entry = self.manifest.get(rel)
+        data = None
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            digest = entry['hash']
+        else:
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+        up_to_date = (
+            entry is not None
+            and entry['hash'] == digest
+            and entry['settings'] == self.settings
+            and os.path.exists(self.output_path(rel))
+        )
+        return up_to_date, data, {'hash': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    # Inputs that need editing, read lazily as run_batch asks for them
+    def work(self, rels):
+        for rel in rels:
+            try:
+                up_to_date, data, info = self._check(rel)
+            except OSError as e:
+                print(f'failed {rel}: {e}', file=sys.stderr)
+                continue
+            if up_to_date:
+                self.manifest[rel].update(info)
+                self.skipped += 1
+                continue
+            if data is None:
+                with open(os.path.join(self.input_dir, rel), 'rb') as f:
+                    data = f.read()
+            self.pending[rel] = info
+            yield rel, data
+
+    # Write atomically, so an interrupted run never leaves a truncated output
+    def write(self, rel, data):
+        out_path = self.output_path(rel)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        tmp = out_path + '.part'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, out_path)
+        self.manifest[rel] = dict(self.pending.pop(rel), settings=self.settings)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Edit a directory tree of photos with a preset.')
+    parser.add_argument('input_dir', help='directory of photos to edit (searched recursively)')
+    parser.add_argument('output_dir', help='directory for the edited photos; the input tree is mirrored')
+    parser.add_argument('--preset', default='base', help='preset name from the presets file (default: %(default)s)')
+    parser.add_argument('--presets', default=PRESETS_FILE, help='presets file (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS,
+                        help='worker processes (default: %(default)s, all cores)')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='jpeg', help='output format (default: %(default)s)')
+    parser.add_argument('--quality', type=int, default=85,
+                        help='encoder quality 1-100; lower is smaller and faster (default: %(default)s)')
+    parser.add_argument('--progressive', action='store_true', help='write progressive JPEGs (smaller, slower to encode)')
+    parser.add_argument('--optimize', action='store_true', help='optimize JPEG Huffman tables (smaller, slower to encode)')
+    parser.add_argument('--webp-method', type=int, default=4, choices=range(7), metavar='0-6',
+                        help='WebP effort; higher is smaller and slower (default: %(default)s)')
+    parser.add_argument('--force', action='store_true', help='edit every input even if its output is up to date')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    preset = PresetStore(args.presets).get(args.preset)
+    if preset is None:
+        print(f'error: no preset named {args.preset!r} in {args.presets}', file=sys.stderr)
+        return 2
+    if args.format == 'webp' and not features.check('webp'):
+        print('error: this Pillow build has no WebP support', file=sys.stderr)
+        return 2
+    format, extension = FORMATS[args.format]
+    if format == 'JPEG':
+        options = {'quality': args.quality, 'progressive': args.progressive, 'optimize': args.optimize}
+    else:
+        options = {'quality': args.quality, 'method': args.webp_method}
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    run = Run(args.input_dir, args.output_dir, preset.params, format, extension, options)
+    if args.force:
+        run.manifest = {}
+    rels = list(find_images(args.input_dir, exclude=args.output_dir))
+    collisions = run.collisions(rels)
+    if collisions:
+        for group in collisions:
+            print(f"error: {', '.join(group)} would all be written to "
+                  f"{os.path.relpath(run.output_path(group[0]), args.output_dir)}", file=sys.stderr)
+        print('rename these inputs so their names differ before the extension', file=sys.stderr)
+        return 2
+    # Forget inputs that no longer exist; their outputs are left alone
+    for rel in set(run.manifest) - set(rels):
+        del run.manifest[rel]
+
+    done = failed = 0
+    start = last_flush = time.monotonic()
+    try:
+        results = run_batch(
+            run.work(rels),
+            preset.params,
+            workers=args.workers,
+            max_in_flight=max(BATCH_MAX_IN_FLIGHT, args.workers * 2),
+            format=format,
+            options=options
+        )
+        for result in results:
+            if result.ok:
+                run.write(result.filename, result.data)
+                done += 1
+            else:
+                run.pending.pop(result.filename, None)
+                print(f'failed {result.filename}: {result.error}', file=sys.stderr)
+                failed += 1
+            if time.monotonic() - last_flush > MANIFEST_FLUSH_SECONDS:
+                save_manifest(run.manifest_path, run.manifest)
+                last_flush = time.monotonic()
+    except KeyboardInterrupt:
+        save_manifest(run.manifest_path, run.manifest)
+        print(f'\ninterrupted after {done} edited; run again to resume', file=sys.stderr)
+        return 130
+    save_manifest(run.manifest_path, run.manifest)
+
+    elapsed = time.monotonic() - start
+    print(f'{done} edited, {run.skipped} up to date, {failed} failed in {elapsed:.1f}s')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
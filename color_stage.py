@@ -0,0 +1,111 @@
+from functools import lru_cache
+from PIL import ImageEnhance
+import metrics
+import struct
+
+# Compiled color stage: warmth, brightness and contrast are folded into one
+# per-channel lookup table, and vibrance and the legacy color slider into one
+# saturation blend, so the color adjustment costs two passes over the pixels
+# instead of six.
+
+LUT_CACHE_SIZE = 64
+
+def _clamp(v):
+    return min(255.0, max(0.0, v))
+
+def _float32(v):
+    return struct.unpack('f', struct.pack('f', v))[0]
+
+# One output level of Image.blend, which ImageEnhance is built on: Pillow
+# computes `a + alpha * (b - a)` in single precision and truncates, so the
+# tables do the same to reproduce the step-by-step result exactly.
+def _blend(a, b, alpha):
+    alpha = _float32(alpha)
+    return int(_clamp(_float32(a + _float32(alpha * (b - a)))))
+
+# Effective red/green multipliers, mirroring the fallback in apply_warmth
+def warmth_multipliers(params):
+    warm_r = params.get('warm_r')
+    warm_g = params.get('warm_g')
+    if warm_r is not None and warm_g is not None:
+        return float(warm_r), float(warm_g)
+    warmth_factor = float(params.get('warmth_factor', 1.08))
+    return warmth_factor, 1 - (warmth_factor - 1) / 3
+
+# Hashable settings tuple used as the compile cache key
+def color_settings(params):
+    warm_r, warm_g = warmth_multipliers(params)
+    return (
+        warm_r,
+        warm_g,
+        float(params.get('brightness', 1.05)),
+        float(params.get('contrast', 1.12)),
+        float(params.get('vibrance', 1.10)),
+        float(params.get('color', 1.0)),
+    )
+
+# Per-channel table for Image.point on an RGB image (R, G and B back to back)
+@lru_cache(maxsize=LUT_CACHE_SIZE)
+def warmth_table(warm_r, warm_g):
+    r = [round(_clamp(i * warm_r)) for i in range(256)]
+    g = [round(_clamp(i * warm_g)) for i in range(256)]
+    return r + g + list(range(256))
+
+# ImageEnhance.Contrast pivots around the mean grey level of the brightened
+# image. We derive it from the channel histograms in one pass instead of
+# materialising the brightened image. Pillow averages per-pixel luma that is
+# already rounded, so when the mean lands next to a half level the pivot can
+# be one level off.
+def contrast_pivot(image, settings, warmed):
+    warm_r, warm_g, brightness = settings[:3]
+    hist = image.histogram()
+    pre = warmth_table(1.0, 1.0) if warmed else warmth_table(warm_r, warm_g)
+    # Pillow's fixed-point RGB -> L weights
+    weights = (19595 / 65536, 38470 / 65536, 7471 / 65536)
+    total = image.size[0] * image.size[1]
+    mean = 0.0
+    for band in range(3):
+        counts = hist[band * 256:(band + 1) * 256]
+        table = pre[band * 256:(band + 1) * 256]
+        s = sum(n * _blend(0, table[i], brightness) for i, n in enumerate(counts) if n)
+        mean += weights[band] * s / total
+    return int(mean + 0.5)
+
+def _channel_transform(settings, pivot, warm):
+    warm_r, warm_g, brightness, contrast = settings[:4]
+    multipliers = (warm_r, warm_g, 1.0) if warm else (1.0, 1.0, 1.0)
+
+    def apply(band, v):
+        v = round(_clamp(v * multipliers[band]))
+        v = _blend(0, v, brightness)
+        if contrast != 1.0:
+            v = _blend(pivot, v, contrast)
+        return v
+    return apply
+
+# Compile warmth, brightness and contrast into one per-channel point table
+@lru_cache(maxsize=LUT_CACHE_SIZE)
+def compile_color_table(settings, pivot, warm=True):
+    transform = _channel_transform(settings, pivot, warm)
+    return [transform(band, i) for band in range(3) for i in range(256)]
+
+# Combined saturation of the vibrance and legacy color sliders. Both are
+# ImageEnhance.Color blends against the same luma, so they collapse into one.
+def saturation_factor(settings):
+    return settings[4] * settings[5]
+
+# Run the color stage on an RGB image. Pass warmed=True when warmth has already
+# been applied (the glow stage sits between warmth and brightness). A tile of
+# a larger image passes the whole image's contrast pivot.
+@metrics.stage('color')
+def apply_color_stage(image, params, warmed=False, pivot=None):
+    settings = color_settings(params)
+    if settings[3] == 1.0:
+        pivot = 0
+    elif pivot is None:
+        pivot = contrast_pivot(image, settings, warmed)
+    image = image.point(compile_color_table(settings, pivot, not warmed))
+    saturation = saturation_factor(settings)
+    if saturation != 1.0:
+        image = ImageEnhance.Color(image).enhance(saturation)
+    return image
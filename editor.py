@@ -0,0 +1,148 @@
+from color_stage import apply_color_stage, color_settings, contrast_pivot, warmth_multipliers, warmth_table
+from PIL import Image, ImageFilter, ImageChops
+import overlays
+import metrics
+import math
+import os
+
+# Images with more pixels than this are edited strip by strip (see
+# edit_image_tiled) so peak memory follows the strip size, not the image size
+TILED_MIN_PIXELS = int(os.environ.get('TILED_MIN_PIXELS', 40_000_000))
+TILE_HEIGHT = int(os.environ.get('TILE_HEIGHT', 512))
+
+# --- Image Editing Functions ---
+def apply_warmth(img, warmth_factor=1.08, warm_r=None, warm_g=None):
+    mul_r, mul_g = warmth_multipliers({'warmth_factor': warmth_factor, 'warm_r': warm_r, 'warm_g': warm_g})
+    return img.point(warmth_table(mul_r, mul_g))
+
+def add_soft_glow(image, strength=0.6, blur_radius=10):
+    blurred = image.filter(ImageFilter.GaussianBlur(radius=blur_radius))
+    return Image.blend(image, blurred, strength)
+
+def edit_image(image, params):
+    return _edit(image, params)
+
+def _edit(image, params, pivot=None, full_size=None, offset=(0, 0)):
+    # Warmth, brightness, contrast, vibrance and color run as one compiled
+    # color stage. Glow sits between warmth and brightness, so when it is on
+    # warmth is applied first and the rest of the stage after the glow.
+    if params.get('glow_strength', 0) > 0:
+        image = warm_image(image, params)
+        image = apply_glow(image, glow_layer(image, params), params)
+        image = apply_color_stage(image, params, warmed=True, pivot=pivot)
+    else:
+        image = apply_color_stage(image, params, pivot=pivot)
+    return apply_effects(image, params, full_size=full_size, offset=offset)
+
+# Rows a tile needs from beyond its edges for the blur stages to match the
+# untiled result: GaussianBlur's three box passes reach about three radii
+def tile_margin(params):
+    margin = 0
+    if params.get('glow_strength', 0) > 0:
+        margin += math.ceil(3 * params.get('glow_blur', 8)) + 2
+    if params.get('sharpness', 1.3) > 0:
+        margin += 3 * 2 + 2
+    return margin
+
+# Same pipeline as edit_image, run on horizontal strips that overlap by
+# tile_margin rows. Each finished strip is written back into `image` (which is
+# modified in place and returned), so only one full-size image is ever held.
+# The contrast pivot comes from the whole image before glow; glow barely moves
+# the mean, so this differs from edit_image by at most a level.
+def edit_image_tiled(image, params, tile_height=TILE_HEIGHT):
+    width, height = image.size
+    margin = tile_margin(params)
+    pivot = contrast_pivot(image, color_settings(params), warmed=False)
+    carry = None
+    for top in range(0, height, tile_height):
+        bottom = min(height, top + tile_height)
+        upper = max(0, top - margin)
+        lower = min(height, bottom + margin)
+        # Rows above `top` were already overwritten; `carry` holds the
+        # original rows this strip needs as its upper margin
+        region = image.crop((0, top, width, lower))
+        if carry is not None:
+            joined = Image.new(image.mode, (width, lower - upper))
+            joined.paste(carry, (0, 0))
+            joined.paste(region, (0, top - upper))
+            region = joined
+        if bottom < height:
+            next_upper = max(0, bottom - margin)
+            carry = region.crop((0, next_upper - upper, width, bottom - upper))
+        edited = _edit(region, params, pivot=pivot, full_size=image.size, offset=(0, upper))
+        image.paste(edited.crop((0, top - upper, width, bottom - upper)), (0, top))
+    return image
+
+# The stages below are what edit_image is made of; the preview renderer
+# calls them one by one so it can cache their outputs.
+@metrics.stage('warmth')
+def warm_image(image, params):
+    return apply_warmth(
+        image,
+        warmth_factor=params.get('warmth_factor', 1.08),
+        warm_r=params.get('warm_r'),
+        warm_g=params.get('warm_g')
+    )
+
+@metrics.stage('glow_blur')
+def glow_layer(image, params):
+    return image.filter(ImageFilter.GaussianBlur(radius=params.get('glow_blur', 8)))
+
+@metrics.stage('glow_blend')
+def apply_glow(image, glow, params):
+    return Image.blend(image, glow, alpha=params.get('glow_strength', 0.15))
+
+# `scale` is the image's pixels per full-resolution pixel (below 1 for preview
+# proxies). A tile passes the size of the whole frame and its offset in it so
+# the overlays line up across tiles.
+def apply_effects(image, params, grain=None, scale=1.0, full_size=None, offset=(0, 0)):
+    # Grain
+    if params.get('grain_strength', 0) > 0:
+        image = add_film_grain(image, grain_strength_at(params.get('grain_strength', 0), scale), noise=grain)
+    # Sun Traces
+    if params.get('sun_traces', 0) > 0:
+        image = add_sun_traces(image, params.get('sun_traces', 0), scale, full_size, offset)
+    # Sharpness
+    sharpness = params.get('sharpness', 1.3)
+    if sharpness > 0:
+        image = sharpen(image, sharpness, scale)
+    return image
+
+# The unsharp radius is in full-resolution pixels, like glow_blur
+@metrics.stage('sharpen')
+def sharpen(image, sharpness, scale=1.0):
+    return image.filter(ImageFilter.UnsharpMask(radius=2 * scale, percent=int(sharpness*100), threshold=3))
+
+# Grain is one noise sample per full-resolution pixel. A proxy pixel averages
+# 1/scale**2 of them, which divides the noise's spread by 1/scale, so a
+# proxy gets finer-looking grain of proportionally lower strength.
+def grain_strength_at(grain_strength, scale=1.0):
+    return grain_strength * scale
+
+def film_grain_layer(size, grain_strength=15):
+    noise = overlays.grain(size, grain_strength)
+    return Image.merge("RGB", (noise, noise, noise))
+
+@metrics.stage('grain')
+def add_film_grain(image, grain_strength=15, noise=None):
+    if noise is None:
+        noise = film_grain_layer(image.size, grain_strength)
+    return ImageChops.add(image, noise, scale=2.0)
+
+def _overlay_for(image, spec, scale, full_size, offset):
+    if full_size is None:
+        return overlays.overlay(spec, image.size, scale)
+    left, top = offset
+    box = (left, top, left + image.width, top + image.height)
+    return overlays.overlay(spec, full_size, scale, box)
+
+# `strength` is the overlay's opacity in percent
+@metrics.stage('light_leak')
+def add_light_leak(image, strength=15, scale=1.0, full_size=None, offset=(0, 0)):
+    leak = _overlay_for(image, overlays.LIGHT_LEAK, scale, full_size, offset)
+    return Image.blend(image, leak, alpha=strength / 100)
+
+@metrics.stage('sun_traces')
+def add_sun_traces(image, strength=12, scale=1.0, full_size=None, offset=(0, 0)):
+    traces = _overlay_for(image, overlays.SUN_TRACES, scale, full_size, offset)
+    return Image.blend(image, traces, alpha=strength / 100)
@@ -0,0 +1,246 @@
+from batch import run_batch
+from zipfile import ZipFile
+import metrics
+import threading
+import shutil
+import queue
+import json
+import time
+import uuid
+import os
+import re
+
+# Background job queue: uploads are spooled into a per-job directory and
+# edited by a bounded pool of runner threads, each of which fans its files
+# out to the shared batch process pool. Job state is mirrored to job.json so
+# any web worker process can report progress and serve the result.
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_QUEUED = int(os.environ.get('JOB_MAX_QUEUED', 16))
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+JOB_CLEANUP_INTERVAL = 60
+
+RESULT_NAME = 'edited_photos.zip'
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+class QueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, job_id, filenames, params):
+        self.id = job_id
+        self.filenames = filenames
+        self.params = params
+        self.status = 'queued'
+        self.total = len(filenames)
+        self.done = 0
+        self.errors = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filenames': self.filenames,
+            'params': self.params,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'errors': self.errors,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['id'], data['filenames'], data['params'])
+        for key in ('status', 'done', 'errors', 'created', 'started', 'finished'):
+            setattr(job, key, data[key])
+        return job
+
+    # Files done, throughput (files/s) and ETA (s) for the status endpoint
+    def progress(self):
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        throughput = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.done
+        eta = remaining / throughput if throughput > 0 and self.status == 'running' else None
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'failed': len(self.errors),
+            'errors': self.errors,
+            'elapsed': round(elapsed, 2),
+            'throughput': round(throughput, 2),
+            'eta': round(eta, 1) if eta is not None else None,
+        }
+
+class JobQueue:
+    def __init__(self, root, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED, ttl=JOB_TTL,
+                 batch_workers=None, max_in_flight=None):
+        self.root = root
+        self.workers = workers
+        self.ttl = ttl
+        self.batch_workers = batch_workers
+        self.max_in_flight = max_in_flight
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def job_dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def result_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), RESULT_NAME)
+
+    # Runner threads start on first use so importing the app stays side-effect free
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f'job-runner-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+            t = threading.Thread(target=self._janitor, name='job-janitor', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    # Spool (filename, stream) uploads to disk and enqueue them as one job.
+    # Raises QueueFull when the backlog is at capacity.
+    def submit(self, uploads, params):
+        self._ensure_started()
+        if self._queue.full():
+            raise QueueFull('Too many jobs are waiting; please try again shortly.')
+        job = Job(uuid.uuid4().hex, [name for name, _ in uploads], params)
+        input_dir = os.path.join(self.job_dir(job.id), 'inputs')
+        os.makedirs(input_dir)
+        for index, (_, stream) in enumerate(uploads):
+            with open(os.path.join(input_dir, str(index)), 'wb') as f:
+                shutil.copyfileobj(stream, f)
+        self._save(job)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            shutil.rmtree(self.job_dir(job.id), ignore_errors=True)
+            raise QueueFull('Too many jobs are waiting; please try again shortly.')
+        return job
+
+    # Look a job up in memory, falling back to the state another process wrote
+    def get(self, job_id):
+        if not _JOB_ID.fullmatch(job_id):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            with open(os.path.join(self.job_dir(job_id), 'job.json')) as f:
+                return Job.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, job):
+        path = os.path.join(self.job_dir(job.id), 'job.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp, path)
+
+    def _inputs(self, job):
+        input_dir = os.path.join(self.job_dir(job.id), 'inputs')
+        for index, filename in enumerate(job.filenames):
+            path = os.path.join(input_dir, str(index))
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.remove(path)
+            yield filename, data
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            except Exception as e:
+                job.status = 'failed'
+                job.errors.append({'filename': None, 'error': f'{type(e).__name__}: {e}'})
+                job.finished = time.time()
+                self._save(job)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job):
+        job.status = 'running'
+        job.started = time.time()
+        self._save(job)
+        tmp_path = self.result_path(job.id) + '.part'
+        with ZipFile(tmp_path, 'w') as zipf:
+            results = run_batch(
+                self._inputs(job),
+                job.params,
+                workers=self.batch_workers,
+                max_in_flight=self.max_in_flight
+            )
+            for result in results:
+                if result.ok:
+                    with metrics.timer('zip_write', len(result.data)):
+                        zipf.writestr(f'edited_{result.filename}', result.data)
+                else:
+                    job.errors.append({'filename': result.filename, 'error': result.error})
+                job.done += 1
+                self._save(job)
+        os.replace(tmp_path, self.result_path(job.id))
+        shutil.rmtree(os.path.join(self.job_dir(job.id), 'inputs'), ignore_errors=True)
+        job.status = 'done'
+        job.finished = time.time()
+        self._save(job)
+
+    # Delete artifacts of jobs that finished more than `ttl` seconds ago, and
+    # of unfinished jobs abandoned for twice that (e.g. after a crash). Jobs
+    # this process has queued or running are never touched; for the rest,
+    # job.json's mtime is the last sign of progress, as runners rewrite it
+    # after every file.
+    def cleanup_expired(self, now=None):
+        now = now or time.time()
+        try:
+            job_ids = os.listdir(self.root)
+        except OSError:
+            return
+        for job_id in job_ids:
+            with self._lock:
+                live = self._jobs.get(job_id)
+            if live is not None and not live.finished:
+                continue
+            job = live or self.get(job_id)
+            if job is not None and job.finished:
+                expired = job.finished + self.ttl < now
+            else:
+                # Unfinished elsewhere, or a half-written job directory
+                try:
+                    expired = self._last_activity(job_id) + 2 * self.ttl < now
+                except OSError:
+                    continue
+            if expired:
+                shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+                with self._lock:
+                    self._jobs.pop(job_id, None)
+
+    def _last_activity(self, job_id):
+        try:
+            return os.path.getmtime(os.path.join(self.job_dir(job_id), 'job.json'))
+        except FileNotFoundError:
+            return os.path.getmtime(self.job_dir(job_id))
+
+    def _janitor(self):
+        while True:
+            self.cleanup_expired()
+            time.sleep(JOB_CLEANUP_INTERVAL)
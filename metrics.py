@@ -0,0 +1,182 @@
+from contextlib import contextmanager
+from cache import image_bytes
+from functools import wraps
+import threading
+import time
+import os
+
+# Optional per-stage timing for the editing pipeline. Stages are timed only
+# while instrumentation is on (PIPELINE_METRICS=1 or enable()); otherwise the
+# wrappers cost one flag check. Pool workers collect their records per file
+# and hand them back with the result, and the parent merges them into the
+# registry served by /metrics. Preview renders run the same stages on small
+# proxies, so they are kept out of the stage histograms (see suppressed()).
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+_enabled = os.environ.get('PIPELINE_METRICS') == '1'
+_local = threading.local()
+
+def enabled():
+    return _enabled
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.allocated = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def observe(self, seconds, nbytes=0):
+        self.count += 1
+        self.total += seconds
+        self.allocated += nbytes
+        ms = seconds * 1000
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    # Upper bucket bound below which `q` of the observations fall
+    def quantile(self, q):
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.buckets):
+            seen += n
+            if n and seen >= target:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 4),
+            'mean_ms': round(self.total * 1000 / self.count, 3) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'allocated_bytes': self.allocated,
+            'buckets_ms': {str(b): n for b, n in zip(BUCKETS_MS, self.buckets)},
+        }
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.images = 0
+            self.failures = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.started = time.time()
+
+    def observe(self, name, seconds, nbytes=0):
+        with self._lock:
+            self.stages.setdefault(name, Histogram()).observe(seconds, nbytes)
+
+    def merge(self, records):
+        with self._lock:
+            for name, seconds, nbytes in records:
+                self.stages.setdefault(name, Histogram()).observe(seconds, nbytes)
+
+    def count_image(self, bytes_in, bytes_out, ok=True):
+        with self._lock:
+            self.images += 1
+            self.failures += 0 if ok else 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.time() - self.started
+            return {
+                'enabled': _enabled,
+                'uptime_s': round(elapsed, 1),
+                'images': self.images,
+                'failures': self.failures,
+                'images_per_s': round(self.images / elapsed, 3) if elapsed > 0 else 0.0,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'stages': {name: h.to_dict() for name, h in sorted(self.stages.items())},
+            }
+
+registry = Registry()
+
+# Instrumentation is on globally, or for this thread inside collect(), and
+# not switched off for this thread by suppressed()
+def _active():
+    if getattr(_local, 'suppressed', False):
+        return False
+    return _enabled or getattr(_local, 'records', None) is not None
+
+def _record(name, seconds, nbytes):
+    records = getattr(_local, 'records', None)
+    if records is not None:
+        records.append((name, seconds, nbytes))
+    else:
+        registry.observe(name, seconds, nbytes)
+
+def _image_bytes(result):
+    try:
+        return image_bytes(result)
+    except AttributeError:
+        return 0
+
+# Decorator timing a pipeline stage; the size of the image it returns is
+# recorded as the stage's allocation
+def stage(name):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _active():
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            _record(name, time.perf_counter() - start, _image_bytes(result))
+            return result
+        return wrapper
+    return decorator
+
+# Context manager timing a block that is not a function of its own
+@contextmanager
+def timer(name, nbytes=0):
+    if not _active():
+        yield
+        return
+    start = time.perf_counter()
+    yield
+    _record(name, time.perf_counter() - start, nbytes)
+
+# Collect this thread's records into a list instead of the registry, e.g. in a
+# pool worker that returns them with its result. Instrumentation is on for the
+# thread inside the block; with active=False the list just stays empty.
+@contextmanager
+def collect(active=True):
+    records = []
+    if not active:
+        yield records
+        return
+    previous = getattr(_local, 'records', None)
+    _local.records = records
+    try:
+        yield records
+    finally:
+        _local.records = previous
+
+# Record nothing from this thread inside the block, e.g. for preview renders
+# whose stage timings would be mixed with full-size edits
+@contextmanager
+def suppressed():
+    previous = getattr(_local, 'suppressed', False)
+    _local.suppressed = True
+    try:
+        yield
+    finally:
+        _local.suppressed = previous
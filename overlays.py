@@ -0,0 +1,81 @@
+from cache import ImageLRU
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFilter
+import random
+import math
+import os
+
+# Overlay generation for the sun-trace, light-leak and grain effects. The
+# overlays only depend on the image size and their parameters, so they are
+# rendered once and reused: the heavily blurred gradients are drawn at low
+# resolution and resampled up, and grain is pasted together from a pool of
+# pre-generated noise tiles.
+
+OVERLAY_CACHE_MB = int(os.environ.get('OVERLAY_CACHE_MB', 256))
+# Low-resolution pixels per blur radius. A gradient blurred this much has no
+# detail finer than that, so resampling it up is indistinguishable.
+OVERLAY_DETAIL = 6
+GRAIN_TILE_SIZE = 512
+GRAIN_POOL_SIZE = 4
+
+# (background, fill, ellipse box, blur radius) in full-resolution pixels
+SUN_TRACES = ((255, 200, 150), (255, 210, 160), (-599, -599, 799, 799), 100)
+LIGHT_LEAK = ((0, 0, 0), (255, 80, 60), (-399, -399, 599, 599), 80)
+
+_overlays = ImageLRU(OVERLAY_CACHE_MB * 1024 * 1024)
+
+# Bound the whole-frame overlay cache of this process. Batch pool workers set
+# it to 0: each worker would otherwise hold its own OVERLAY_CACHE_MB of
+# full-resolution overlays, and resampling the cached low-resolution render
+# is cheap next to editing a full-size photo.
+def set_cache_mb(cache_mb):
+    _overlays.resize(cache_mb * 1024 * 1024)
+
+# Low-resolution render of `spec` for a frame of `size` pixels, where `scale`
+# is the frame's pixels per full-resolution pixel (below 1 for previews).
+# Returns the render and its pixels per frame pixel.
+@lru_cache(maxsize=32)
+def _render_low(spec, size, scale):
+    background, fill, box, radius = spec
+    radius *= scale
+    factor = min(1.0, OVERLAY_DETAIL / radius) if radius > 0 else 1.0
+    low_size = (max(1, math.ceil(size[0] * factor)), max(1, math.ceil(size[1] * factor)))
+    low = Image.new('RGB', low_size, background)
+    draw = ImageDraw.Draw(low)
+    draw.ellipse([v * scale * factor for v in box], fill=fill)
+    low = low.filter(ImageFilter.GaussianBlur(radius=radius * factor))
+    return low, factor
+
+# Overlay for a frame of `size`, or for the `box` region of it when the frame
+# is edited in tiles. Whole-frame overlays are cached by size.
+def overlay(spec, size, scale=1.0, box=None):
+    if box is None:
+        key = (spec, size, scale)
+        return _overlays.cached(key, lambda: overlay(spec, size, scale, (0, 0) + size))
+    low, factor = _render_low(spec, size, scale)
+    return low.resize(
+        (box[2] - box[0], box[3] - box[1]),
+        Image.Resampling.BILINEAR,
+        box=tuple(v * factor for v in box)
+    )
+
+# Noise tiles for one grain strength, in every flip so repeats are less regular
+@lru_cache(maxsize=8)
+def _grain_tiles(grain_strength):
+    tiles = []
+    for _ in range(GRAIN_POOL_SIZE):
+        tile = Image.effect_noise((GRAIN_TILE_SIZE, GRAIN_TILE_SIZE), grain_strength)
+        tiles.append(tile)
+        tiles.append(tile.transpose(Image.Transpose.FLIP_LEFT_RIGHT))
+        tiles.append(tile.transpose(Image.Transpose.FLIP_TOP_BOTTOM))
+        tiles.append(tile.transpose(Image.Transpose.ROTATE_180))
+    return tiles
+
+# Single-band grain for `size`, pasted together from randomly chosen tiles
+def grain(size, grain_strength):
+    tiles = _grain_tiles(grain_strength)
+    layer = Image.new('L', size)
+    for y in range(0, size[1], GRAIN_TILE_SIZE):
+        for x in range(0, size[0], GRAIN_TILE_SIZE):
+            layer.paste(random.choice(tiles), (x, y))
+    return layer
@@ -1,19 +1,21 @@
+from contextlib import contextmanager
+import threading
+import logging
 import json
+import time
 import os
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 PRESETS_FILE = 'presets.json'
+# Seconds between checks of the file's mtime for changes by other processes
+PRESET_RELOAD_INTERVAL = 1.0
 
-# Load presets from file
-def load_presets():
-    if os.path.exists(PRESETS_FILE):
-        with open(PRESETS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-# Save presets to file
-def save_presets(presets):
-    with open(PRESETS_FILE, 'w') as f:
-        json.dump(presets, f, indent=2)
+log = logging.getLogger(__name__)
 
 # Get default/base preset
 
@@ -51,14 +53,170 @@ CHATGPT_TEMPLATE = {
     "sun_traces_effect": False
 }
 
-# On first run, save base preset if not present
-presets = load_presets()
-changed = False
-if "base" not in presets:
-    presets["base"] = BASE_PRESET
-    changed = True
-if "chatgpt_template" not in presets:
-    presets["chatgpt_template"] = CHATGPT_TEMPLATE
-    changed = True
-if changed:
-    save_presets(presets)
+# Values the editor has always used for keys older presets leave out
+MISSING_DEFAULTS = {
+    "warmth_factor": 1.08,
+    "vibrance": 1.10,
+    "sharpness": 1.3,
+    "sun_traces": 12
+}
+
+# Preset values -> edit_image parameters
+def preset_params(values):
+    params = {key: values[key] for key in (
+        'warmth_factor', 'warm_r', 'warm_g', 'glow_strength', 'glow_blur',
+        'brightness', 'contrast', 'vibrance', 'color', 'sharpness'
+    )}
+    params['grain_strength'] = values['grain_strength'] if values['grain_effect'] else 0
+    params['sun_traces'] = values['sun_traces'] if values['sun_traces_effect'] else 0
+    return params
+
+# Spellings accepted for switches, e.g. from a hand-edited presets.json
+BOOL_STRINGS = {'true': True, 'false': False, '1': True, '0': False,
+                'on': True, 'off': False, 'yes': True, 'no': False}
+
+def _parse_bool(raw):
+    if isinstance(raw, bool):
+        return raw
+    if isinstance(raw, int) and raw in (0, 1):
+        return bool(raw)
+    if isinstance(raw, str) and raw.strip().lower() in BOOL_STRINGS:
+        return BOOL_STRINGS[raw.strip().lower()]
+    raise ValueError(raw)
+
+# Coerce an entry to BASE_PRESET's keys and types. Missing or invalid values
+# fall back to the defaults; unknown keys are dropped.
+def normalize_preset(entry, name=None):
+    values = {}
+    for key, base in BASE_PRESET.items():
+        default = MISSING_DEFAULTS.get(key, base)
+        raw = entry.get(key, default) if isinstance(entry, dict) else default
+        try:
+            if isinstance(base, bool):
+                value = _parse_bool(raw)
+            elif isinstance(base, int):
+                value = int(raw)
+            else:
+                value = float(raw)
+        except (TypeError, ValueError):
+            log.warning('Preset %r: invalid %s %r, using %r', name, key, raw, default)
+            value = default
+        values[key] = value
+    return values
+
+# A validated preset: its values, the edit_image parameters they compile to,
+# and the strings the form renders for them (so an unchanged form submission
+# can be matched without parsing)
+class Preset:
+    def __init__(self, name, values):
+        self.name = name
+        self.values = values
+        self.params = preset_params(values)
+        self.form = {key: str(value) for key, value in values.items()}
+
+# Used when the form names a preset that does not exist
+DEFAULT_PRESET = Preset('base', normalize_preset(BASE_PRESET))
+
+@contextmanager
+def _file_lock(path):
+    with open(path + '.lock', 'a+') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# In-memory copy of presets.json, reloaded when the file's mtime changes.
+# Writes take a file lock and replace the file atomically, so concurrent
+# workers never see a truncated file or lose each other's presets.
+class PresetStore:
+    def __init__(self, path=PRESETS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked = 0.0
+        self._presets = {}
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = {}
+        except ValueError:
+            log.exception('Could not parse %s; keeping the presets already loaded', self.path)
+            return None
+        if not isinstance(raw, dict):
+            log.error('%s does not hold an object of presets; keeping the presets already loaded', self.path)
+            return None
+        raw.setdefault('base', BASE_PRESET)
+        raw.setdefault('chatgpt_template', CHATGPT_TEMPLATE)
+        return {name: Preset(name, normalize_preset(entry, name)) for name, entry in raw.items()}
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._presets and now - self._checked < PRESET_RELOAD_INTERVAL:
+            return
+        self._checked = now
+        stamp = self._file_stamp()
+        if force or stamp != self._stamp or not self._presets:
+            presets = self._read()
+            if presets is not None:
+                self._presets = presets
+                self._stamp = stamp
+
+    def presets(self):
+        with self._lock:
+            self._refresh()
+            return self._presets
+
+    def get(self, name):
+        return self.presets().get(name)
+
+    # Values of every preset, by name
+    def load(self):
+        return {name: preset.values for name, preset in self.presets().items()}
+
+    # Add or replace one preset; the file is re-read under the lock first so
+    # presets saved by other processes are kept
+    def save(self, name, values):
+        self.update({name: values})
+
+    def update(self, entries):
+        with self._lock, _file_lock(self.path):
+            self._refresh(force=True)
+            data = {n: p.values for n, p in self._presets.items()}
+            for name, values in entries.items():
+                data[name] = normalize_preset(values, name)
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._refresh(force=True)
+
+store = PresetStore()
+
+# Load presets from file
+def load_presets():
+    return store.load()
+
+# Save presets to file
+def save_presets(presets):
+    store.update(presets)
@@ -0,0 +1,94 @@
+from cache import ImageLRU
+from color_stage import apply_color_stage, color_settings, warmth_multipliers
+from editor import warm_image, glow_layer, apply_glow, apply_effects, film_grain_layer, grain_strength_at
+from PIL import Image, UnidentifiedImageError
+import metrics
+import hashlib
+import io
+import os
+
+# Live preview: an upload is decoded once into a downscaled proxy, keyed by
+# its content hash. Renders run the edit_image stages on the proxy and keep
+# each stage's output in an LRU, so moving one slider only reruns the stages
+# downstream of it.
+
+PREVIEW_SIZE = int(os.environ.get('PREVIEW_SIZE', 1024))
+PREVIEW_CACHE_MB = int(os.environ.get('PREVIEW_CACHE_MB', 256))
+PREVIEW_QUALITY = 80
+
+# Decode to at most `size` pixels on the long side. For JPEG, draft() makes
+# the decoder scale by 1/2, 1/4 or 1/8 itself, so the full image is never built.
+def decode_proxy(data, size=PREVIEW_SIZE):
+    try:
+        image = Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        raise ValueError('not a supported image file') from None
+    full_width = image.width
+    image.draft('RGB', (size, size))
+    image = image.convert('RGB')
+    image.thumbnail((size, size))
+    image.info['scale'] = image.width / full_width
+    return image
+
+class PreviewRenderer:
+    def __init__(self, size=PREVIEW_SIZE, cache_mb=PREVIEW_CACHE_MB):
+        self.size = size
+        self.cache = ImageLRU(cache_mb * 1024 * 1024)
+
+    # Decode and cache an upload; returns its key (the content hash)
+    def load(self, data):
+        key = hashlib.sha1(data).hexdigest()
+        if self.cache.get(('proxy', key)) is None:
+            self.cache.put(('proxy', key), decode_proxy(data, self.size))
+        return key
+
+    def proxy(self, key):
+        return self.cache.get(('proxy', key))
+
+    # Render params on the proxy for `key`; None if the upload was evicted
+    def render(self, key, params):
+        proxy = self.proxy(key)
+        if proxy is None:
+            return None
+        params = dict(params)
+        # Blur radii are in pixels, so shrink them with the proxy (apply_effects
+        # does the same for the unsharp radius and grain)
+        params['glow_blur'] = params.get('glow_blur', 8) * proxy.info.get('scale', 1.0)
+        settings = color_settings(params)
+        if params.get('glow_strength', 0) > 0:
+            warm = warmth_multipliers(params)
+            warmed = self.cache.cached(('warm', key, warm), lambda: warm_image(proxy, params))
+            glow = self.cache.cached(
+                ('glow', key, warm, params['glow_blur']),
+                lambda: glow_layer(warmed, params)
+            )
+            glowed = self.cache.cached(
+                ('blend', key, warm, params['glow_blur'], params['glow_strength']),
+                lambda: apply_glow(warmed, glow, params)
+            )
+            image = self.cache.cached(
+                ('color', key, settings, params['glow_blur'], params['glow_strength']),
+                lambda: apply_color_stage(glowed, params, warmed=True)
+            )
+        else:
+            image = self.cache.cached(('color', key, settings), lambda: apply_color_stage(proxy, params))
+        scale = proxy.info.get('scale', 1.0)
+        grain = None
+        if params.get('grain_strength', 0) > 0:
+            strength = grain_strength_at(params['grain_strength'], scale)
+            grain = self.cache.cached(
+                ('grain', image.size, strength),
+                lambda: film_grain_layer(image.size, strength)
+            )
+        return apply_effects(image, params, grain=grain, scale=scale)
+
+    # Preview latency is recorded as a whole, as `preview_render`; its stages
+    # stay out of the per-stage histograms, which describe full-size edits
+    def render_jpeg(self, key, params, quality=PREVIEW_QUALITY):
+        with metrics.timer('preview_render'), metrics.suppressed():
+            image = self.render(key, params)
+            if image is None:
+                return None
+            out = io.BytesIO()
+            image.save(out, format='JPEG', quality=quality)
+        return out.getvalue()
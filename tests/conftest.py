@@ -0,0 +1,38 @@
+from PIL import Image, ImageChops, ImageStat
+import pytest
+import random
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from presets import PresetStore
+
+# Every preset in the repo's presets.json (plus the built-in ones)
+PRESETS = PresetStore(os.path.join(ROOT, 'presets.json')).presets()
+
+# Deterministic photo stand-in: smooth gradients, hard edges and fine noise
+def textured_image(size=(640, 427), seed=0, noise=True):
+    random.seed(seed)
+    r = Image.linear_gradient('L').resize(size)
+    g = Image.radial_gradient('L').resize(size)
+    b = Image.effect_mandelbrot(size, (-2.0, -1.0, 1.0, 1.0), 64)
+    if not noise:
+        return Image.merge('RGB', (r, g, b))
+    noise = Image.new('L', size)
+    noise.putdata([random.randrange(64) for _ in range(size[0] * size[1])])
+    return ImageChops.add(Image.merge('RGB', (r, g, b)), Image.merge('RGB', (noise,) * 3))
+
+# (max, mean) absolute difference over all channels
+def difference(a, b):
+    diff = ImageChops.difference(a, b)
+    return max(high for _, high in diff.getextrema()), sum(ImageStat.Stat(diff).mean) / 3
+
+@pytest.fixture
+def image():
+    return textured_image()
+
+@pytest.fixture(params=sorted(PRESETS))
+def params(request):
+    return PRESETS[request.param].params
@@ -0,0 +1,71 @@
+from PIL import Image
+from zipfile import ZipFile
+from jobs import JobQueue
+import app as webapp
+import pytest
+import time
+import io
+
+STATES = ['queued', 'running', 'done']
+
+def jpeg(color):
+    out = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(out, format='JPEG')
+    return out.getvalue()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    def use_queue(**kwargs):
+        queue = JobQueue(str(tmp_path / 'jobs'), batch_workers=2, **kwargs)
+        monkeypatch.setattr(webapp, 'job_queue', queue)
+        return queue
+    client = webapp.app.test_client()
+    client.use_queue = use_queue
+    return client
+
+def submit(client, files):
+    data = {'preset': 'chatgpt_template', 'file': [(io.BytesIO(body), name) for name, body in files]}
+    return client.post('/', data=data, content_type='multipart/form-data')
+
+def test_job_reports_progress_errors_and_result(client):
+    client.use_queue()
+    response = submit(client, [('a.jpg', jpeg('red')), ('bad.jpg', b'not an image'), ('b.jpg', jpeg('blue'))])
+    assert response.status_code == 302
+    job_id = response.headers['Location'].rsplit('/', 1)[-1]
+
+    seen = []
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        status = client.get(f'/jobs/{job_id}/status').get_json()
+        if not seen or seen[-1] != status['status']:
+            seen.append(status['status'])
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.05)
+    # States only move forward
+    assert seen == sorted(seen, key=STATES.index) and seen[-1] == 'done'
+    assert status['total'] == 3 and status['done'] == 3 and status['failed'] == 1
+    assert status['errors'] == [{'filename': 'bad.jpg', 'error': 'ValueError: not a supported image file'}]
+
+    response = client.get(f'/jobs/{job_id}/result')
+    assert response.status_code == 200
+    with ZipFile(io.BytesIO(response.data)) as zipf:
+        assert sorted(zipf.namelist()) == ['edited_a.jpg', 'edited_b.jpg']
+
+def test_result_is_409_until_the_job_is_done(client):
+    # No runner threads, so the job stays queued
+    client.use_queue(workers=0)
+    response = submit(client, [('a.jpg', jpeg('red'))])
+    job_id = response.headers['Location'].rsplit('/', 1)[-1]
+    response = client.get(f'/jobs/{job_id}/result')
+    assert response.status_code == 409
+    assert response.get_json()['status'] == 'queued'
+    assert client.get('/jobs/' + '0' * 32 + '/result').status_code == 404
+
+def test_full_queue_is_turned_away_with_retry_after(client):
+    client.use_queue(workers=0, max_queued=1)
+    assert submit(client, [('a.jpg', jpeg('red'))]).status_code == 302
+    response = submit(client, [('b.jpg', jpeg('blue'))])
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+    assert b'Too many jobs are waiting' in response.data
@@ -0,0 +1,45 @@
+from PIL import Image
+from batch import run_batch
+import time
+import io
+import os
+
+def jpeg(color):
+    out = io.BytesIO()
+    Image.new('RGB', (32, 24), color).save(out, format='JPEG')
+    return out.getvalue()
+
+# Kill the worker process, like the kernel does when it runs out of memory.
+# The delay lets the file submitted before it finish first.
+def _die(delay):
+    time.sleep(delay)
+    os._exit(1)
+
+# Input whose unpickling in the worker calls _die
+class WorkerKiller(bytes):
+    def __reduce__(self):
+        return (_die, (0.2,))
+
+PARAMS = {'sharpness': 0}
+
+def test_batch_survives_a_worker_dying_between_results():
+    items = [('a.jpg', jpeg('red')), ('kill.jpg', WorkerKiller(b'x')),
+             ('b.jpg', jpeg('green')), ('c.jpg', jpeg('blue'))]
+    results = []
+    for result in run_batch(items, PARAMS, workers=2, max_in_flight=2):
+        results.append(result)
+        # The worker dies while the consumer is busy with this result, so the
+        # next submit finds the pool already broken
+        time.sleep(0.5)
+    assert [r.filename for r in results] == ['a.jpg', 'kill.jpg', 'b.jpg', 'c.jpg']
+    assert [r.ok for r in results] == [True, False, True, True]
+    assert results[1].error == 'worker process died'
+
+    # Later batches get a working pool
+    results = list(run_batch([('d.jpg', jpeg('white'))], PARAMS, workers=2))
+    assert results[0].ok
+
+def test_undecodable_file_is_reported():
+    results = list(run_batch([('bad.jpg', b'not an image'), ('a.jpg', jpeg('red'))], PARAMS, workers=1))
+    assert results[0].error == 'ValueError: not a supported image file'
+    assert results[1].ok
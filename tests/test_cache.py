@@ -0,0 +1,25 @@
+from PIL import Image
+from cache import ImageLRU, image_bytes
+from batch import get_pool
+
+def test_image_bytes_matches_pillow_storage():
+    assert image_bytes(Image.new('RGB', (10, 10))) == 400
+    assert image_bytes(Image.new('RGBA', (10, 10))) == 400
+    assert image_bytes(Image.new('L', (10, 10))) == 100
+
+def test_lru_stays_within_bound():
+    lru = ImageLRU(1000)
+    for i in range(5):
+        lru.put(i, Image.new('RGB', (10, 10)))
+    assert lru.size == 800
+    lru.put(5, Image.new('RGB', (10, 10)))
+    assert lru.size == 800 and lru.get(0) is None and lru.get(5) is not None
+    lru.resize(0)
+    assert lru.size == 0 and lru.get(5) is None
+
+def _worker_overlay_cache_bytes():
+    import overlays
+    return overlays._overlays.max_bytes
+
+def test_pool_workers_do_not_cache_whole_frame_overlays():
+    assert get_pool(2).submit(_worker_overlay_cache_bytes).result() == 0
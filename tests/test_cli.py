@@ -0,0 +1,45 @@
+from PIL import Image
+import json
+import cli
+import os
+
+COMMON_ARGS = ['--preset', 'chatgpt_template', '--workers', '1']
+
+def write_image(path, color):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', (64, 48), color).save(path)
+
+def run(input_dir, output_dir, *args):
+    presets = os.path.join(os.path.dirname(cli.__file__), 'presets.json')
+    return cli.main([str(input_dir), str(output_dir), '--presets', presets, *COMMON_ARGS, *args])
+
+def test_rerun_skips_up_to_date_outputs(tmp_path, capsys):
+    write_image(tmp_path / 'in' / 'a.jpg', 'red')
+    write_image(tmp_path / 'in' / 'sub' / 'b.png', 'green')
+    assert run(tmp_path / 'in', tmp_path / 'out') == 0
+    assert '2 edited, 0 up to date' in capsys.readouterr().out
+    assert (tmp_path / 'out' / 'sub' / 'b.jpg').exists()
+
+    assert run(tmp_path / 'in', tmp_path / 'out') == 0
+    assert '0 edited, 2 up to date' in capsys.readouterr().out
+
+    # A changed encoder setting invalidates every output
+    assert run(tmp_path / 'in', tmp_path / 'out', '--quality', '70') == 0
+    assert '2 edited, 0 up to date' in capsys.readouterr().out
+
+def test_inputs_sharing_an_output_name_are_rejected(tmp_path, capsys):
+    write_image(tmp_path / 'in' / 'sub' / 'b.jpg', 'green')
+    write_image(tmp_path / 'in' / 'sub' / 'b.png', 'blue')
+    assert run(tmp_path / 'in', tmp_path / 'out') == 2
+    err = capsys.readouterr().err
+    assert 'sub/b.jpg, sub/b.png would all be written to sub/b.jpg' in err
+    # Nothing was edited or recorded
+    assert not (tmp_path / 'out' / 'sub').exists()
+    assert not (tmp_path / 'out' / cli.MANIFEST_NAME).exists()
+
+def test_output_dir_inside_input_dir_is_not_an_input(tmp_path, capsys):
+    write_image(tmp_path / 'in' / 'sub' / 'a.jpg', 'red')
+    assert run(tmp_path / 'in', tmp_path / 'in' / 'out') == 0
+    assert run(tmp_path / 'in', tmp_path / 'in' / 'out') == 0
+    assert '0 edited, 1 up to date' in capsys.readouterr().out.splitlines()[-1]
+    assert not (tmp_path / 'in' / 'out' / 'out').exists()
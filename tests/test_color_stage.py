@@ -0,0 +1,47 @@
+from PIL import Image, ImageEnhance, ImageFilter
+from conftest import difference
+from color_stage import warmth_multipliers
+from editor import edit_image
+
+# The color adjustments as edit_image ran them before they were compiled:
+# split/merge warmth, glow, then one ImageEnhance pass per slider
+def reference_edit(image, params):
+    warm_r, warm_g = warmth_multipliers(params)
+    r, g, b = image.split()
+    r = r.point(lambda i: min(255, max(0, i * warm_r)))
+    g = g.point(lambda i: min(255, max(0, i * warm_g)))
+    image = Image.merge('RGB', (r, g, b))
+    if params.get('glow_strength', 0) > 0:
+        glow = image.filter(ImageFilter.GaussianBlur(radius=params.get('glow_blur', 8)))
+        image = Image.blend(image, glow, alpha=params.get('glow_strength', 0.15))
+    image = ImageEnhance.Brightness(image).enhance(params.get('brightness', 1.05))
+    image = ImageEnhance.Contrast(image).enhance(params.get('contrast', 1.12))
+    image = ImageEnhance.Color(image).enhance(params.get('vibrance', 1.10))
+    image = ImageEnhance.Color(image).enhance(params.get('color', 1.0))
+    sharpness = params.get('sharpness', 1.3)
+    if sharpness > 0:
+        image = image.filter(ImageFilter.UnsharpMask(radius=2, percent=int(sharpness*100), threshold=3))
+    return image
+
+# Grain is random and the overlays are not part of the color stage
+def color_only(params, **overrides):
+    return dict(params, grain_strength=0, sun_traces=0, **overrides)
+
+def test_matches_reference_within_tolerance(image, params):
+    params = color_only(params)
+    max_diff, mean_diff = difference(edit_image(image.copy(), params), reference_edit(image, params))
+    # Vibrance and color are folded into one saturation blend; sharpening
+    # amplifies the rounding differences that leaves
+    assert max_diff <= 10
+    assert mean_diff < 1.0
+
+def test_exact_with_one_saturation_blend(image, params):
+    # With at most one of the two saturation sliders active, the compiled
+    # stage reproduces the step-by-step pipeline
+    params = color_only(params, color=1.0)
+    assert difference(edit_image(image.copy(), params), reference_edit(image, params)) == (0, 0.0)
+
+def test_exact_warmth_brightness_contrast(image):
+    params = color_only({}, warm_r=1.08, warm_g=0.97, brightness=1.05, contrast=1.12,
+                        vibrance=1.0, color=1.0, glow_strength=0, sharpness=0)
+    assert difference(edit_image(image.copy(), params), reference_edit(image, params)) == (0, 0.0)
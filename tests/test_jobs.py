@@ -0,0 +1,33 @@
+from jobs import JobQueue, Job
+import time
+import os
+
+def make_job(queue, job_id, age, status='queued', finished=None):
+    job = Job(job_id * 32, ['photo.jpg'], {})
+    job.created = time.time() - age
+    job.status = status
+    job.finished = finished
+    os.makedirs(queue.job_dir(job.id))
+    queue._save(job)
+    return job
+
+def set_mtime(queue, job, age):
+    path = os.path.join(queue.job_dir(job.id), 'job.json')
+    os.utime(path, (time.time() - age,) * 2)
+
+def test_cleanup_keeps_live_and_recently_active_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path), ttl=10)
+    running = make_job(queue, 'a', age=1000, status='running')
+    queue._jobs[running.id] = running
+    set_mtime(queue, running, 1000)
+    active = make_job(queue, 'b', age=1000, status='running')
+    abandoned = make_job(queue, 'c', age=1000, status='running')
+    set_mtime(queue, abandoned, 100)
+    expired = make_job(queue, 'd', age=1000, status='done', finished=time.time() - 100)
+    fresh = make_job(queue, 'e', age=1000, status='done', finished=time.time())
+
+    queue.cleanup_expired()
+
+    remaining = set(os.listdir(tmp_path))
+    assert remaining == {running.id, active.id, fresh.id}
+    assert abandoned.id not in remaining and expired.id not in remaining
@@ -0,0 +1,25 @@
+from conftest import textured_image
+from editor import edit_image
+from preview import PreviewRenderer
+import metrics
+import pytest
+import io
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, '_enabled', True)
+    metrics.registry.reset()
+    yield metrics.registry
+    metrics.registry.reset()
+
+def test_full_size_edits_record_stages(registry, params):
+    edit_image(textured_image(), params)
+    assert 'color' in registry.snapshot()['stages']
+
+def test_previews_stay_out_of_stage_histograms(registry, params):
+    renderer = PreviewRenderer(size=256)
+    out = io.BytesIO()
+    textured_image().save(out, format='PNG')
+    key = renderer.load(out.getvalue())
+    assert renderer.render_jpeg(key, params)
+    assert list(registry.snapshot()['stages']) == ['preview_render']
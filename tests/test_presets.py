@@ -0,0 +1,63 @@
+from multiprocessing import Pool
+from presets import PresetStore, normalize_preset, BASE_PRESET
+import presets
+import json
+import os
+
+def test_normalize_parses_switches():
+    values = normalize_preset({'grain_effect': 'false', 'sun_traces_effect': '0'})
+    assert values['grain_effect'] is False
+    assert values['sun_traces_effect'] is False
+    values = normalize_preset({'grain_effect': 'true', 'sun_traces_effect': 1})
+    assert values['grain_effect'] is True
+    assert values['sun_traces_effect'] is True
+
+def test_normalize_replaces_invalid_values_with_defaults():
+    values = normalize_preset({'grain_effect': 'maybe', 'contrast': 'high', 'grain_strength': None,
+                               'unknown': 1}, 'bad')
+    assert values['grain_effect'] is BASE_PRESET['grain_effect']
+    assert values['contrast'] == BASE_PRESET['contrast']
+    assert values['grain_strength'] == BASE_PRESET['grain_strength']
+    assert set(values) == set(BASE_PRESET)
+
+def test_normalize_keeps_saved_zero_sun_traces():
+    assert normalize_preset({'sun_traces': 0})['sun_traces'] == 0
+    assert normalize_preset({})['sun_traces'] == 12
+
+def test_reload_after_external_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(presets, 'PRESET_RELOAD_INTERVAL', 0)
+    path = tmp_path / 'presets.json'
+    path.write_text(json.dumps({'soft': {'contrast': 1.0}}))
+    store = PresetStore(str(path))
+    assert store.get('soft').values['contrast'] == 1.0
+
+    path.write_text(json.dumps({'soft': {'contrast': 1.5}, 'new': {}}))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+    assert store.get('soft').values['contrast'] == 1.5
+    assert store.get('new') is not None
+
+def test_unusable_file_keeps_last_good_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(presets, 'PRESET_RELOAD_INTERVAL', 0)
+    path = tmp_path / 'presets.json'
+    path.write_text(json.dumps({'soft': {'contrast': 1.0}}))
+    store = PresetStore(str(path))
+    assert store.get('soft') is not None
+    for content in ('[1, 2]', '{"soft": '):
+        path.write_text(content)
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+        assert store.get('soft').values['contrast'] == 1.0
+
+def _save_many(args):
+    path, worker = args
+    store = PresetStore(path)
+    for i in range(10):
+        store.save(f'preset-{worker}-{i}', {'contrast': 1.0 + i / 10})
+
+def test_concurrent_saves_from_several_processes_keep_every_preset(tmp_path):
+    path = str(tmp_path / 'presets.json')
+    with Pool(4) as pool:
+        pool.map(_save_many, [(path, worker) for worker in range(4)])
+    with open(path) as f:
+        saved = json.load(f)
+    assert {f'preset-{w}-{i}' for w in range(4) for i in range(10)} <= set(saved)
+    assert saved['preset-3-9']['contrast'] == 1.9
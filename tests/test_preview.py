@@ -0,0 +1,39 @@
+from PIL import Image, ImageStat
+from conftest import textured_image, difference, PRESETS
+from editor import edit_image
+from preview import PreviewRenderer
+import io
+
+# A 2048px photo previewed at 512px, i.e. one proxy pixel per 4x4 pixels
+FULL_SIZE = (2048, 1366)
+PREVIEW_SIZE = 512
+
+def load(renderer, image):
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return renderer.load(out.getvalue())
+
+def downscaled(image, size=PREVIEW_SIZE):
+    image = image.copy()
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return image
+
+def test_preview_sharpens_like_the_download():
+    image = textured_image(FULL_SIZE, noise=False)
+    renderer = PreviewRenderer(size=PREVIEW_SIZE)
+    key = load(renderer, image)
+    params = dict(PRESETS['chatgpt_template'].params)
+    max_diff, mean_diff = difference(renderer.render(key, params), downscaled(edit_image(image, params)))
+    # Unscaled, the proxy is sharpened as if at radius 8: about 100 max, 0.7 mean
+    assert max_diff <= 80
+    assert mean_diff < 0.55
+
+def test_preview_grain_matches_the_download():
+    image = Image.new('RGB', FULL_SIZE, (120, 120, 120))
+    renderer = PreviewRenderer(size=PREVIEW_SIZE)
+    key = load(renderer, image)
+    params = {'warm_r': 1.0, 'warm_g': 1.0, 'brightness': 1.0, 'contrast': 1.0, 'vibrance': 1.0,
+              'color': 1.0, 'glow_strength': 0, 'sharpness': 0, 'sun_traces': 0, 'grain_strength': 30}
+    preview_spread = ImageStat.Stat(renderer.render(key, params)).stddev[0]
+    download_spread = ImageStat.Stat(downscaled(edit_image(image, params))).stddev[0]
+    assert abs(preview_spread - download_spread) < download_spread * 0.3